@@ -1,19 +1,30 @@
-import json
+import hashlib
+import hmac
 import os
+import time
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, Tuple
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-from jose import jwt
+import jwt
+import orjson
 
 # Configuration JWT
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = "HS256"
+_SECRET_KEY_BYTES = SECRET_KEY.encode("utf-8")  # encodé une seule fois
 ACCESS_TOKEN_EXPIRE_MINUTES = 480  # 8 heures
+TOKEN_CACHE_SIZE = 4096  # Nombre max de tokens vérifiés gardés en cache
 
 security = HTTPBearer()
 
+ADMIN_USERS_FILE = "admin_users.json"
+
+# Cache des utilisateurs admin (invalidé sur changement de mtime du fichier)
+_USERS_CACHE: Dict[str, Any] = {"mtime": 0, "data": None}
+
 # Models Pydantic
 class LoginRequest(BaseModel):
    username: str
@@ -26,25 +37,41 @@ class TokenResponse(BaseModel):
    username: str
 
 # Chargement des utilisateurs admin
-def load_admin_users() -> Dict[str, str]:
-   """Charge les utilisateurs admin depuis admin_users.json"""
+def _hash_password(password: str) -> bytes:
+   """Empreinte SHA-256 d'un mot de passe (aucun mot de passe en clair en mémoire)"""
+   return hashlib.sha256(password.encode("utf-8")).digest()
+
+def load_admin_users() -> Dict[str, bytes]:
+   """Charge les utilisateurs admin depuis admin_users.json (avec cache sur mtime)"""
    try:
-       with open("admin_users.json", "r") as f:
-           return json.load(f)
+       mtime = os.stat(ADMIN_USERS_FILE).st_mtime_ns
    except FileNotFoundError:
        # Créer un fichier par défaut si inexistant
        default_users = {
            "admin": "admin123"
        }
-       with open("admin_users.json", "w") as f:
-           json.dump(default_users, f, indent=2)
-       return default_users
+       with open(ADMIN_USERS_FILE, "wb") as f:
+           f.write(orjson.dumps(default_users, option=orjson.OPT_INDENT_2))
+       mtime = os.stat(ADMIN_USERS_FILE).st_mtime_ns
+   
+   if _USERS_CACHE["data"] is not None and _USERS_CACHE["mtime"] == mtime:
+       return _USERS_CACHE["data"]
+   
+   with open(ADMIN_USERS_FILE, "rb") as f:
+       users = orjson.loads(f.read())
+   
+   _USERS_CACHE["mtime"] = mtime
+   _USERS_CACHE["data"] = {u: _hash_password(p) for u, p in users.items()}
+   return _USERS_CACHE["data"]
 
 # Services d'authentification
 def authenticate_user(username: str, password: str) -> bool:
-   """Authentifie un utilisateur"""
+   """Authentifie un utilisateur (comparaison en temps constant)"""
    users = load_admin_users()
-   return users.get(username) == password
+   expected = users.get(username)
+   if expected is None:
+       return False
+   return hmac.compare_digest(expected, _hash_password(password))
 
 def create_access_token(username: str) -> str:
    """Crée un token JWT"""
@@ -56,16 +83,34 @@ def create_access_token(username: str) -> str:
        "exp": expire
    }
    
-   return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+   return jwt.encode(to_encode, _SECRET_KEY_BYTES, algorithm=ALGORITHM)
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def _decode_uncached(token: str) -> Tuple[str, float]:
+   """Décode un token JWT et retourne (username, exp), mis en cache par token
+   
+   Lève jwt.InvalidTokenError pour un token invalide: lru_cache ne met pas les
+   exceptions en cache, seuls les tokens valides occupent donc le cache.
+   """
+   payload = jwt.decode(
+       token,
+       _SECRET_KEY_BYTES,
+       algorithms=[ALGORITHM],
+       options={"verify_aud": False, "require": ["exp", "sub"]}
+   )
+   return payload["sub"], payload["exp"]
 
 def verify_token(token: str) -> Optional[str]:
    """Vérifie et décode un token JWT, retourne le username"""
    try:
-       payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-       username = payload.get("sub")
-       return username
-   except jwt.PyJWTError:
+       username, exp = _decode_uncached(token)
+   except jwt.InvalidTokenError:
        return None
+   
+   # Le cache ne revérifie pas la signature: on contrôle l'expiration à chaque appel
+   if exp <= time.time():
+       return None
+   return username
 
 # Middleware de protection
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
@@ -1,11 +1,14 @@
-import json
+import asyncio
 import os
-import requests
-from datetime import datetime
-from typing import Optional, Dict, Any
-from fastapi import APIRouter, HTTPException, Depends
+import httpx
+import orjson
+from datetime import datetime, timezone
+from time import time_ns
+from typing import Optional, Dict, Any, Tuple
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from auth import get_current_user
+from settings import WORKER_URL, TEST_CONFIG_PATH
 
 # Models
 class ExecutionResponse(BaseModel):
@@ -18,43 +21,54 @@ class ExecutionResponse(BaseModel):
    duration: Optional[str] = None
 
 # Configuration
-UPLOAD_DIR = "/tmp/loadtest"
-WORKER_URL = os.getenv("WORKER_URL", "http://worker:8090")
+WORKER_TIMEOUT = 300  # 5 minutes de timeout
+
+# Dernière configuration chargée et version de test_config.json correspondante
+# (chaque upload remplace le fichier: les versions précédentes ne servent plus)
+_CONFIG_CACHE: Dict[str, Any] = {"key": None, "config": None}
 
 # Fonctions utilitaires
-def parse_csv_to_dict(csv_content: str) -> list[Dict[str, str]]:
-   """Convertit le contenu CSV en liste de dictionnaires"""
-   import csv
-   import io
+def create_worker_client() -> httpx.AsyncClient:
+   """Crée le client HTTP partagé vers le worker (connexions keep-alive)
+   
+   Créé au démarrage de l'app (lifespan) et stocké dans app.state.worker_client.
+   """
+   return httpx.AsyncClient(base_url=WORKER_URL, timeout=WORKER_TIMEOUT)
+
+def _file_key(path: str) -> Optional[Tuple[int, int, int]]:
+   """Identifie une version d'un fichier par (inode, mtime_ns, taille), None si absent
    
+   L'inode change à chaque os.replace de la sauvegarde, même si deux versions
+   ont le même mtime (granularité de l'horloge noyau) et la même taille.
+   """
    try:
-       csv_reader = csv.DictReader(io.StringIO(csv_content))
-       users = []
-       
-       for row in csv_reader:
-           # Nettoyer les espaces dans les clés et valeurs
-           clean_row = {k.strip(): v.strip() for k, v in row.items()}
-           users.append(clean_row)
-       
-       return users
+       st = os.stat(path)
+   except FileNotFoundError:
+       return None
+   return st.st_ino, st.st_mtime_ns, st.st_size
+
+def load_test_config(config_path: str) -> Dict[str, Any]:
+   """Charge la configuration pré-construite du worker (en cache tant que le fichier ne change pas)"""
+   key = _file_key(config_path)
+   if _CONFIG_CACHE["config"] is not None and _CONFIG_CACHE["key"] == key:
+       return _CONFIG_CACHE["config"]
    
-   except Exception as e:
-       print(f"Erreur de parsing CSV: {e}")
-       return []
+   with open(config_path, 'rb') as f:
+       test_config = orjson.loads(f.read())
+   
+   _CONFIG_CACHE["key"] = key
+   _CONFIG_CACHE["config"] = test_config
+   return test_config
 
 # Router
 router = APIRouter(prefix="/execute", tags=["execution"])
 
 @router.post("", response_model=ExecutionResponse)
-async def execute_test(current_user: str = Depends(get_current_user)):
+async def execute_test(request: Request, current_user: str = Depends(get_current_user)):
    """Lance l'exécution d'un test de charge via le worker Go"""
    
-   # Vérifier que les fichiers validés existent
-   scenario_path = f"{UPLOAD_DIR}/scenario.json"
-   variables_path = f"{UPLOAD_DIR}/variables.json"
-   users_path = f"{UPLOAD_DIR}/users.csv"
-   
-   if not os.path.exists(scenario_path) or not os.path.exists(variables_path):
+   # Vérifier que la configuration validée existe
+   if not os.path.exists(TEST_CONFIG_PATH):
        return ExecutionResponse(
            status="failed",
            test_id="",
@@ -62,52 +76,29 @@ async def execute_test(current_user: str = Depends(get_current_user)):
            error="Veuillez d'abord uploader et valider scenario.json et variables.json"
        )
    
+   # Générer un ID unique pour ce test (défini avant le try pour les messages d'erreur)
+   test_id = f"test_{time_ns()}"
+   
    try:
-       # Lire les fichiers de configuration
-       with open(scenario_path, 'r') as f:
-           scenario_data = json.load(f)
-       
-       with open(variables_path, 'r') as f:
-           variables_data = json.load(f)
-       
-       # Lire le fichier users.csv si présent
-       users_data = []
-       if os.path.exists(users_path):
-           with open(users_path, 'r') as f:
-               csv_content = f.read()
-               users_data = parse_csv_to_dict(csv_content)
-       
-       # Générer un ID unique pour ce test
-       test_id = f"test_{int(datetime.now().timestamp())}"
-       
-       # Préparer la configuration pour le worker
-       test_config = {
-           "mode": variables_data.get("mode", "users"),
-           "virtualUsers": variables_data.get("virtualUsers", 1),
-           "totalRequests": variables_data.get("totalRequests", 100),
-           "duration": variables_data.get("duration", "2m"),
-           "warmup": variables_data.get("warmup", "30s"),
-           "environment": variables_data.get("environment", {}),
-           "scenario": scenario_data,
-           "usersData": users_data
-       }
+       # Charger la configuration (hors de la boucle d'événements)
+       test_config = await asyncio.to_thread(load_test_config, TEST_CONFIG_PATH)
        
        # Préparer la requête pour le worker
        worker_request = {
            "test_id": test_id,
            "config": test_config,
-           "timestamp": datetime.now().isoformat() + "Z"
+           "timestamp": datetime.now(timezone.utc).isoformat()
        }
        
        # Envoyer la requête au worker Go
-       worker_response = requests.post(
-           f"{WORKER_URL}/execute",
-           json=worker_request,
-           timeout=300  # 5 minutes de timeout
+       worker_response = await request.app.state.worker_client.post(
+           "/execute",
+           content=orjson.dumps(worker_request),
+           headers={"Content-Type": "application/json"}
        )
        
        if worker_response.status_code == 200:
-           result = worker_response.json()
+           result = orjson.loads(worker_response.content)
            
            return ExecutionResponse(
                status=result.get("status", "completed"),
@@ -126,7 +117,7 @@ async def execute_test(current_user: str = Depends(get_current_user)):
                error=f"HTTP {worker_response.status_code}: {worker_response.text}"
            )
    
-   except requests.exceptions.Timeout:
+   except httpx.TimeoutException:
        return ExecutionResponse(
            status="timeout",
            test_id=test_id,
@@ -134,7 +125,7 @@ async def execute_test(current_user: str = Depends(get_current_user)):
            error="Le test a pris plus de 5 minutes à s'exécuter"
        )
    
-   except requests.exceptions.ConnectionError:
+   except httpx.ConnectError:
        return ExecutionResponse(
            status="failed",
            test_id=test_id,
@@ -151,12 +142,12 @@ async def execute_test(current_user: str = Depends(get_current_user)):
        )
 
 @router.get("/worker/health")
-async def check_worker_health(current_user: str = Depends(get_current_user)):
+async def check_worker_health(request: Request, current_user: str = Depends(get_current_user)):
    """Vérifie que le worker est accessible"""
    try:
-       response = requests.get(f"{WORKER_URL}/health", timeout=5)
+       response = await request.app.state.worker_client.get("/health", timeout=5)
        if response.status_code == 200:
-           worker_status = response.json()
+           worker_status = orjson.loads(response.content)
            return {
                "status": "connected",
                "worker_status": worker_status,
@@ -1,13 +1,28 @@
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 # Imports des routers
 from auth import router as auth_router
 from upload import router as upload_router
-from execution import router as execution_router
+from execution import router as execution_router, create_worker_client
 
-app = FastAPI(title="Orchestrator API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+   # Client HTTP vers le worker, lié à la boucle d'événements de l'app
+   app.state.worker_client = create_worker_client()
+   yield
+   # Fermeture des connexions vers le worker
+   await app.state.worker_client.aclose()
+
+app = FastAPI(
+   title="Orchestrator API",
+   version="0.1.0",
+   default_response_class=ORJSONResponse,
+   lifespan=lifespan
+)
 
 app.add_middleware(
    CORSMiddleware,
@@ -0,0 +1,11 @@
+import os
+
+# Configuration partagée par les routers
+UPLOAD_DIR = "/tmp/loadtest"
+WORKER_URL = os.getenv("WORKER_URL", "http://worker:8090")
+
+# Fichiers validés sauvegardés dans UPLOAD_DIR
+SCENARIO_PATH = os.path.join(UPLOAD_DIR, "scenario.json")
+VARIABLES_PATH = os.path.join(UPLOAD_DIR, "variables.json")
+USERS_PATH = os.path.join(UPLOAD_DIR, "users.csv")
+TEST_CONFIG_PATH = os.path.join(UPLOAD_DIR, "test_config.json")
\ No newline at end of file
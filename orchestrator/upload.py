@@ -1,12 +1,16 @@
-import json
+import asyncio
 import csv
+import hashlib
 import io
 import os
 import re
-from typing import Optional, List, Dict, Any
+import threading
+import orjson
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 from fastapi import APIRouter, File, UploadFile, Depends
 from pydantic import BaseModel
 from auth import get_current_user
+from settings import UPLOAD_DIR, SCENARIO_PATH, VARIABLES_PATH, USERS_PATH, TEST_CONFIG_PATH
 
 # Models
 class ValidationResult(BaseModel):
@@ -17,41 +21,146 @@ class ValidationResult(BaseModel):
    analysis: Dict[str, Any] = {}
 
 # Configuration
-UPLOAD_DIR = "/tmp/loadtest"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Pattern des variables {{xxx}}, compilé une seule fois
+_VAR_RE = re.compile(r'\{\{([^}]+)\}\}')
+
+# Préfixes de variables ({{user.xxx}}, {{env.xxx}}) associés à leur catégorie
+_PREFIXED_BUCKETS = frozenset({"user", "env"})
+
+# Espaces autour d'une valeur CSV que skipinitialspace ne retire pas: espace avant
+# un séparateur/guillemet/fin de ligne ou en début de ligne/de champ cité. Tout autre
+# blanc ASCII (tabulation...) ou octet non ASCII (espaces Unicode) déclenche aussi le nettoyage.
+_SURROUNDING_WS_RE = re.compile(
+   rb'[\t\x0b\x0c\x1c-\x1f\x80-\xff]| (?:[,"\r\n]|\Z)|(?:\A|["\r\n]) '
+)
+
+# Champs obligatoires de chaque étape du scénario
+_REQUIRED_STEP_FIELDS = ("name", "method", "url")
+
+# Valeurs autorisées
+_VALID_METHODS = frozenset({"GET", "POST", "PUT", "DELETE", "PATCH"})
+_VALID_MODES = frozenset({"users", "requests"})
+
+# Tailles maximales acceptées par fichier uploadé (en octets)
+_MAX_UPLOAD_SIZES = {
+   "scenario.json": 2 << 20,     # 2 Mo
+   "variables.json": 512 << 10,  # 512 Ko
+   "users.csv": 32 << 20         # 32 Mo
+}
+
+# Cache LRU des résultats de validation, indexé par le SHA-256 des fichiers uploadés.
+# Chaque entrée garde (résultat, configuration sérialisée, taille de la configuration);
+# le cache est borné en nombre d'entrées et en octets de configuration conservés.
+VALIDATION_CACHE_SIZE = 32
+VALIDATION_CACHE_MAX_BYTES = 64 << 20  # 64 Mo
+_VALIDATION_CACHE: Dict[Tuple[Optional[bytes], ...], Tuple[ValidationResult, Optional[bytes], int]] = {}
+
 # Fonctions utilitaires
 def extract_variables_from_text(text: str) -> List[str]:
    """Extrait toutes les variables {{xxx}} d'un texte"""
-   pattern = r'\{\{([^}]+)\}\}'
-   return re.findall(pattern, text)
+   return _VAR_RE.findall(text)
+
+def _iter_templated_strings(obj: Any) -> Iterator[str]:
+   """Parcourt un objet JSON (pile explicite, sans récursion) et produit les chaînes contenant '{{', clés comprises"""
+   stack = [obj]
+   pop = stack.pop
+   extend = stack.extend
+   while stack:
+       node = pop()
+       if isinstance(node, str):
+           if "{{" in node:
+               yield node
+       elif isinstance(node, dict):
+           extend(node.keys())
+           extend(node.values())
+       elif isinstance(node, list):
+           extend(node)
 
 def extract_variables_from_scenario(scenario_data: dict) -> Dict[str, List[str]]:
    """Extrait toutes les variables du scénario et les catégorise"""
-   variables = {
-       "user": [],  # Variables {{user.xxx}}
-       "env": [],   # Variables {{env.xxx}} ou autres
-       "extract": [] # Variables extraites d'étapes précédentes
+   # Accumulation dans des sets: déduplication en O(1)
+   buckets = {
+       "user": set(),    # Variables {{user.xxx}}
+       "env": set(),     # Variables {{env.xxx}} ou autres
+       "extract": set()  # Variables extraites d'étapes précédentes
+   }
+   
+   # Le regex n'est appliqué qu'aux chaînes du scénario contenant '{{', sans re-sérialisation
+   for text in _iter_templated_strings(scenario_data):
+       for match in _VAR_RE.finditer(text):
+           var = match.group(1)
+           # Un seul découpage sur le premier '.' (préfixe retiré sans toucher au reste du nom)
+           prefix, sep, name = var.partition(".")
+           if sep and prefix in _PREFIXED_BUCKETS:
+               buckets[prefix].add(name)
+           else:
+               # Variables extraites ou autres
+               buckets["extract"].add(var)
+   
+   # Listes triées pour un résultat stable
+   return {k: sorted(v) for k, v in buckets.items()}
+
+def write_file(path: str, data: bytes) -> None:
+   """Écrit des octets via os.write, sans objet fichier bufferisé"""
+   fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+   try:
+       view = memoryview(data)
+       while view:
+           written = os.write(fd, view)
+           view = view[written:]
+   finally:
+       os.close(fd)
+
+def build_test_config(scenario_data: dict, variables_data: dict,
+                     users_data: List[Dict[str, str]]) -> Dict[str, Any]:
+   """Construit la configuration envoyée au worker à partir des fichiers validés"""
+   return {
+       "mode": variables_data.get("mode", "users"),
+       "virtualUsers": variables_data.get("virtualUsers", 1),
+       "totalRequests": variables_data.get("totalRequests", 100),
+       "duration": variables_data.get("duration", "2m"),
+       "warmup": variables_data.get("warmup", "30s"),
+       "environment": variables_data.get("environment", {}),
+       "scenario": scenario_data,
+       "usersData": users_data
+   }
+
+def save_validated_files(scenario_content: bytes, variables_content: bytes,
+                        users_content: Optional[bytes], test_config: bytes) -> None:
+   """Sauvegarde les fichiers validés et la configuration du worker (I/O bloquantes)
+   
+   Chaque fichier est d'abord écrit dans un fichier temporaire, puis tous sont
+   renommés avec os.replace: une erreur en cours d'écriture ne laisse pas de
+   fichiers à moitié mis à jour dans UPLOAD_DIR.
+   """
+   # Fichiers sauvegardés tels qu'uploadés (déjà vérifiés, pas de re-sérialisation)
+   files = {
+       SCENARIO_PATH: scenario_content,
+       VARIABLES_PATH: variables_content
    }
+   if users_content is not None:
+       files[USERS_PATH] = users_content
+   
+   # Configuration du worker pré-construite, relue telle quelle à l'exécution
+   files[TEST_CONFIG_PATH] = test_config
    
-   scenario_text = json.dumps(scenario_data)
-   all_vars = extract_variables_from_text(scenario_text)
-   
-   for var in all_vars:
-       if var.startswith("user."):
-           column_name = var.replace("user.", "")
-           if column_name not in variables["user"]:
-               variables["user"].append(column_name)
-       elif var.startswith("env."):
-           env_var = var.replace("env.", "")
-           if env_var not in variables["env"]:
-               variables["env"].append(env_var)
-       else:
-           # Variables extraites ou autres
-           if var not in variables["extract"]:
-               variables["extract"].append(var)
-   
-   return variables
+   suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+   temp_paths = {}
+   try:
+       for path, data in files.items():
+           temp_path = f"{path}.{suffix}"
+           temp_paths[path] = temp_path
+           write_file(temp_path, data)
+       
+       for path, temp_path in temp_paths.items():
+           os.replace(temp_path, path)
+   finally:
+       # Nettoyer les fichiers temporaires restants en cas d'erreur
+       for temp_path in temp_paths.values():
+           if os.path.exists(temp_path):
+               os.remove(temp_path)
 
 def validate_scenario_structure(scenario_data: dict) -> List[str]:
    """Valide la structure basique du scénario"""
@@ -81,12 +190,16 @@ def validate_scenario_structure(scenario_data: dict) -> List[str]:
            errors.append(f"L'étape {i+1} doit être un objet")
            continue
        
-       required_fields = ["name", "method", "url"]
-       for field in required_fields:
+       # Chemin rapide pour une étape valide; le détail des erreurs n'est construit qu'en cas d'échec
+       method = step.get("method")
+       if "name" in step and "url" in step and isinstance(method, str) and method in _VALID_METHODS:
+           continue
+       
+       for field in _REQUIRED_STEP_FIELDS:
            if field not in step:
                errors.append(f"L'étape {i+1} '{step.get('name', 'sans nom')}' manque le champ '{field}'")
        
-       if "method" in step and step["method"] not in ["GET", "POST", "PUT", "DELETE", "PATCH"]:
+       if "method" in step and (not isinstance(step["method"], str) or step["method"] not in _VALID_METHODS):
            errors.append(f"L'étape {i+1} a une méthode HTTP invalide: {step['method']}")
    
    return errors
@@ -102,7 +215,7 @@ def validate_variables_structure(variables_data: dict) -> List[str]:
    # Validation du mode
    if "mode" not in variables_data:
        errors.append("Le fichier variables doit spécifier un 'mode'")
-   elif variables_data["mode"] not in ["users", "requests"]:
+   elif not isinstance(variables_data["mode"], str) or variables_data["mode"] not in _VALID_MODES:
        errors.append("Le mode doit être 'users' ou 'requests'")
    
    # Validation selon le mode
@@ -121,39 +234,55 @@ def validate_variables_structure(variables_data: dict) -> List[str]:
    
    return errors
 
-def validate_csv_structure(csv_content: str) -> tuple[List[str], List[str]]:
-   """Valide la structure du CSV et retourne (erreurs, colonnes)"""
+def validate_csv_structure(csv_bytes: bytes) -> tuple[List[str], List[str], List[Dict[str, str]]]:
+   """Valide et parse le CSV (contenu brut) en une passe, retourne (erreurs, colonnes, lignes)
+   
+   Les espaces après les virgules sont ignorés par le lecteur CSV; les valeurs ne sont
+   nettoyées une à une que si d'autres espaces entourent des valeurs du fichier.
+   """
    errors = []
    columns = []
+   rows = []
+   strip_values = _SURROUNDING_WS_RE.search(csv_bytes) is not None
    
    try:
-       csv_reader = csv.reader(io.StringIO(csv_content))
+       # Décodage à la volée, sans copie str complète du fichier
+       csv_reader = csv.reader(
+           io.TextIOWrapper(io.BytesIO(csv_bytes), encoding='utf-8', newline=''),
+           skipinitialspace=True
+       )
        headers = next(csv_reader, None)
        
        if not headers:
            errors.append("Le fichier CSV est vide ou n'a pas d'en-têtes")
-           return errors, columns
+           return errors, columns, rows
        
        # Nettoyer les colonnes (supprimer espaces)
-       columns = [col.strip() for col in headers if col.strip()]
+       clean_headers = [col.strip() for col in headers]
+       columns = [col for col in clean_headers if col]
        
        if len(columns) == 0:
            errors.append("Le fichier CSV n'a pas de colonnes valides")
-           return errors, columns
+           return errors, columns, rows
        
-       # Vérifier qu'il y a au moins une ligne de données
-       row_count = 0
+       # Parser les lignes et vérifier qu'il y a au moins une ligne de données
+       has_data = False
        for row in csv_reader:
-           if any(cell.strip() for cell in row):  # Au moins une cellule non vide
-               row_count += 1
+           if not row:
+               continue
+           if strip_values:
+               row = [cell.strip() for cell in row]
+           if not has_data and ''.join(row).strip():  # Au moins une cellule non vide
+               has_data = True
+           rows.append(dict(zip(clean_headers, row)))
        
-       if row_count == 0:
+       if not has_data:
            errors.append("Le fichier CSV n'a pas de données (seulement des en-têtes)")
        
    except Exception as e:
        errors.append(f"Erreur de parsing CSV: {str(e)}")
    
-   return errors, columns
+   return errors, columns, rows
 
 def validate_cross_file_consistency(scenario_vars: Dict[str, List[str]], 
                                  variables_data: dict, 
@@ -161,72 +290,66 @@ def validate_cross_file_consistency(scenario_vars: Dict[str, List[str]],
    """Valide la cohérence entre les 3 fichiers"""
    errors = []
    
+   user_vars = scenario_vars["user"]
+   env_vars = scenario_vars["env"]
+   mode = variables_data.get("mode")
+   
+   # Rien à vérifier sans variables user/env hors mode 'users'
+   if not user_vars and not env_vars and mode != "users":
+       return errors
+   
+   env_section = variables_data.get("environment", {})
+   
    # 1. Vérifier que les variables user.xxx existent dans le CSV
-   for user_var in scenario_vars["user"]:
-       if user_var not in csv_columns:
+   csv_set = frozenset(csv_columns)
+   for user_var in user_vars:
+       if user_var not in csv_set:
            errors.append(f"Variable '{{{{user.{user_var}}}}}' utilisée dans le scénario mais colonne '{user_var}' manquante dans users.csv")
    
    # 2. Vérifier que les variables env.xxx existent dans variables.json
-   env_section = variables_data.get("environment", {})
-   for env_var in scenario_vars["env"]:
+   for env_var in env_vars:
        if env_var not in env_section:
            errors.append(f"Variable '{{{{env.{env_var}}}}}' utilisée dans le scénario mais '{env_var}' manquant dans variables.json > environment")
    
    # 3. Vérifier cohérence mode vs présence du CSV
-   mode = variables_data.get("mode")
    if mode == "users" and len(csv_columns) == 0:
        errors.append("Mode 'users' spécifié mais fichier users.csv manquant ou vide")
    
    return errors
 
-# Router
-router = APIRouter(prefix="/upload", tags=["upload"])
-
-@router.post("/validate", response_model=ValidationResult)
-async def validate_files(
-   current_user: str = Depends(get_current_user),
-   scenario: UploadFile = File(...),
-   variables: UploadFile = File(...),
-   users: Optional[UploadFile] = File(None)
-):
-   """Upload et validation intelligente des 3 fichiers avec analyse de cohérence"""
+def analyze_files(scenario_content: bytes, variables_content: bytes,
+                 users_content: Optional[bytes]) -> Tuple[ValidationResult, Optional[bytes]]:
+   """Parse et valide les 3 fichiers, retourne (résultat, configuration du worker sérialisée si valide)"""
    
    errors = []
    warnings = []
    analysis = {}
    
-   # 1. Lecture et parsing des fichiers
+   # 1. Parsing des fichiers
    try:
-       # Lire scenario.json
-       scenario_content = await scenario.read()
-       scenario_data = json.loads(scenario_content.decode('utf-8'))
-       
-       # Lire variables.json
-       variables_content = await variables.read()
-       variables_data = json.loads(variables_content.decode('utf-8'))
+       scenario_data = orjson.loads(scenario_content)
+       variables_data = orjson.loads(variables_content)
        
-       # Lire users.csv (optionnel)
        csv_columns = []
-       if users:
-           users_content = await users.read()
-           csv_content = users_content.decode('utf-8')
-           csv_errors, csv_columns = validate_csv_structure(csv_content)
+       users_rows = []
+       if users_content is not None:
+           csv_errors, csv_columns, users_rows = validate_csv_structure(users_content)
            errors.extend(csv_errors)
        
-   except json.JSONDecodeError as e:
+   except orjson.JSONDecodeError as e:
        errors.append(f"Erreur JSON: {str(e)}")
        return ValidationResult(
            status="error",
            message="Erreur de parsing des fichiers JSON",
            errors=errors
-       )
+       ), None
    except Exception as e:
        errors.append(f"Erreur de lecture: {str(e)}")
        return ValidationResult(
            status="error", 
            message="Erreur de lecture des fichiers",
            errors=errors
-       )
+       ), None
    
    # 2. Validation structure de chaque fichier
    scenario_errors = validate_scenario_structure(scenario_data)
@@ -246,32 +369,13 @@ async def validate_files(
        errors.extend(consistency_errors)
    
    # 5. Warnings et informations
-   if users is None and scenario_vars["user"]:
+   if users_content is None and scenario_vars["user"]:
        warnings.append(f"Fichier users.csv non fourni mais variables utilisateur détectées: {scenario_vars['user']}")
    
-   if not scenario_vars["user"] and users:
+   if not scenario_vars["user"] and users_content is not None:
        warnings.append("Fichier users.csv fourni mais aucune variable utilisateur détectée dans le scénario")
    
-   # 6. Sauvegarde si tout est valide
-   if not errors:
-       try:
-           # Sauvegarder les fichiers validés
-           with open(f"{UPLOAD_DIR}/scenario.json", "w") as f:
-               json.dump(scenario_data, f, indent=2)
-           
-           with open(f"{UPLOAD_DIR}/variables.json", "w") as f:
-               json.dump(variables_data, f, indent=2)
-           
-           if users:
-               with open(f"{UPLOAD_DIR}/users.csv", "wb") as f:
-                   f.write(users_content)
-           
-           analysis["files_saved"] = True
-           
-       except Exception as e:
-           errors.append(f"Erreur de sauvegarde: {str(e)}")
-   
-   # 7. Résultat final
+   # 6. Résultat de l'analyse
    if errors:
        return ValidationResult(
            status="error",
@@ -279,11 +383,107 @@ async def validate_files(
            errors=errors,
            warnings=warnings,
            analysis=analysis
+       ), None
+   
+   return ValidationResult(
+       status="success",
+       message="Tous les fichiers sont valides et cohérents",
+       warnings=warnings,
+       analysis=analysis
+   ), orjson.dumps(build_test_config(scenario_data, variables_data, users_rows))
+
+# Router
+router = APIRouter(prefix="/upload", tags=["upload"])
+
+@router.post("/validate", response_model=ValidationResult)
+async def validate_files(
+   current_user: str = Depends(get_current_user),
+   scenario: UploadFile = File(...),
+   variables: UploadFile = File(...),
+   users: Optional[UploadFile] = File(None)
+):
+   """Upload et validation intelligente des 3 fichiers avec analyse de cohérence"""
+   
+   errors = []
+   
+   # 1. Lecture concurrente des fichiers (users.csv optionnel)
+   uploads = {"scenario.json": scenario, "variables.json": variables}
+   if users:
+       uploads["users.csv"] = users
+   
+   # Refuser les fichiers trop volumineux avant de les charger en mémoire
+   for name, upload in uploads.items():
+       if upload.size is not None and upload.size > _MAX_UPLOAD_SIZES[name]:
+           errors.append(f"Le fichier {name} est trop volumineux ({upload.size} octets, maximum {_MAX_UPLOAD_SIZES[name]})")
+   if errors:
+       return ValidationResult(
+           status="error",
+           message="Fichiers trop volumineux",
+           errors=errors
        )
-   else:
+   
+   contents = await asyncio.gather(
+       *(upload.read() for upload in uploads.values()),
+       return_exceptions=True
+   )
+   
+   for name, content in zip(uploads, contents):
+       if isinstance(content, Exception):
+           errors.append(f"Erreur de lecture de {name}: {str(content)}")
+   if errors:
        return ValidationResult(
-           status="success",
-           message="Tous les fichiers sont valides et cohérents",
-           warnings=warnings,
-           analysis=analysis
-       )
\ No newline at end of file
+           status="error",
+           message="Erreur de lecture des fichiers",
+           errors=errors
+       )
+   
+   scenario_content, variables_content = contents[0], contents[1]
+   users_content = contents[2] if users else None
+   
+   # 2. Analyse des fichiers, réutilisée si le même triplet a déjà été validé
+   key = tuple(
+       hashlib.sha256(content).digest() if content is not None else None
+       for content in (scenario_content, variables_content, users_content)
+   )
+   cached = _VALIDATION_CACHE.get(key)
+   if cached is None:
+       cached_result, test_config = analyze_files(scenario_content, variables_content, users_content)
+       # Seule la configuration sérialisée est conservée: c'est elle qui compte dans le budget
+       entry_size = len(test_config or b"")
+       # Les configurations trop volumineuses ne sont pas mises en cache
+       if entry_size <= VALIDATION_CACHE_MAX_BYTES:
+           # Éviction des entrées les moins récemment utilisées au-delà des limites
+           while _VALIDATION_CACHE and (
+               len(_VALIDATION_CACHE) >= VALIDATION_CACHE_SIZE
+               or sum(entry[2] for entry in _VALIDATION_CACHE.values()) + entry_size > VALIDATION_CACHE_MAX_BYTES
+           ):
+               _VALIDATION_CACHE.pop(next(iter(_VALIDATION_CACHE)), None)
+           _VALIDATION_CACHE[key] = (cached_result, test_config, entry_size)
+   else:
+       # Entrée replacée en fin de dict: la plus récemment utilisée
+       _VALIDATION_CACHE[key] = _VALIDATION_CACHE.pop(key)
+       cached_result, test_config, _ = cached
+   
+   # Copie: le résultat en cache ne doit pas être modifié
+   result = cached_result.model_copy(deep=True)
+   
+   # 3. Sauvegarde si tout est valide
+   if test_config is not None:
+       try:
+           # Écritures disque hors de la boucle d'événements
+           await asyncio.to_thread(
+               save_validated_files, scenario_content, variables_content, users_content, test_config
+           )
+           result.analysis["files_saved"] = True
+           
+       except Exception as e:
+           errors.append(f"Erreur de sauvegarde: {str(e)}")
+           return ValidationResult(
+               status="error",
+               message=f"Validation échouée: {len(errors)} erreur(s) détectée(s)",
+               errors=errors,
+               warnings=result.warnings,
+               analysis=result.analysis
+           )
+   
+   return result
\ No newline at end of file